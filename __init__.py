@@ -4,6 +4,13 @@
 Выполняет двухэтапный OCR: сначала Markdown, затем JSON.
 """
 
-from .pipeline import Pipeline
+import time
+
+_import_started = time.perf_counter()
+
+from .lazy_imports import record_import_time  # noqa: E402
+from .pipeline import Pipeline  # noqa: E402
+
+record_import_time(__name__, time.perf_counter() - _import_started)
 
 __all__ = ["Pipeline"]
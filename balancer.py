@@ -0,0 +1,211 @@
+"""Балансировка запросов между несколькими репликами VLM-сервера."""
+
+import hashlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .concurrency import is_overload_error
+from .config import (
+    VLM_EJECT_FAILURES,
+    VLM_EJECT_SECONDS,
+    VLM_STICKY_SLACK,
+)
+
+
+def is_endpoint_error(exc: BaseException) -> bool:
+    """
+    Проверяет, указывает ли исключение на проблему конкретной реплики.
+
+    Такие ошибки (перегрузка, 5xx, обрыв соединения) имеет смысл повторить
+    на другой реплике; ошибки запроса (4xx) повторять бессмысленно.
+
+    Args:
+        exc: Исключение, возникшее при запросе к VLM
+
+    Returns:
+        True, если запрос стоит повторить на другой реплике
+    """
+    if is_overload_error(exc):
+        return True
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return isinstance(exc, _transport_error_types())
+
+
+def _transport_error_types() -> Tuple[type, ...]:
+    # Обрыв потока приходит как «сырое» исключение httpx, без обёртки openai.
+    # Модули не импортируются ради проверки: если исключение из них, они
+    # уже загружены.
+    types: List[type] = [ConnectionError]
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        types.append(httpx.TransportError)
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        types.append(openai.APIConnectionError)
+    return tuple(types)
+
+
+class _Endpoint:
+    """Состояние одной реплики."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+
+class EndpointPool:
+    """
+    Пул реплик VLM с выбором по наименьшему числу активных запросов.
+
+    Здоровье реплик проверяется пассивно: после `eject_failures` ошибок подряд
+    реплика исключается из ротации на `eject_seconds`. По истечении срока она
+    снова получает запросы, и первая же ошибка исключает её повторно.
+
+    При передаче `sticky_key` запросы одного документа направляются на одну
+    реплику (rendezvous hashing) ради попаданий в prefix-кэш, пока она не
+    отстаёт от наименее загруженной больше чем на `sticky_slack` запросов.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        eject_failures: int = VLM_EJECT_FAILURES,
+        eject_seconds: float = VLM_EJECT_SECONDS,
+        sticky_slack: int = VLM_STICKY_SLACK,
+    ):
+        if not urls:
+            raise ValueError("Не задан ни один адрес VLM API")
+        self._lock = threading.Lock()
+        self._endpoints = [_Endpoint(url) for url in urls]
+        self._eject_failures = eject_failures
+        self._eject_seconds = eject_seconds
+        self._sticky_slack = sticky_slack
+
+    def __len__(self) -> int:
+        return len(self._endpoints)
+
+    def pick(
+        self, sticky_key: Optional[str] = None, exclude: Sequence[str] = ()
+    ) -> str:
+        """
+        Выбирает реплику для очередного запроса.
+
+        Args:
+            sticky_key: Ключ привязки (например, хэш документа)
+            exclude: Реплики, уже опробованные для этого запроса
+
+        Returns:
+            URL выбранной реплики
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                ep
+                for ep in self._endpoints
+                if ep.url not in exclude and ep.ejected_until <= now
+            ]
+            if not candidates:
+                # Все реплики исключены: берём ту, что вернётся в ротацию раньше
+                remaining = [ep for ep in self._endpoints if ep.url not in exclude]
+                candidates = [
+                    min(remaining or self._endpoints, key=lambda ep: ep.ejected_until)
+                ]
+
+            least = min(candidates, key=lambda ep: ep.outstanding)
+            if sticky_key is None:
+                return least.url
+
+            sticky = max(
+                candidates, key=lambda ep: _rendezvous_score(sticky_key, ep.url)
+            )
+            if sticky.outstanding - least.outstanding > self._sticky_slack:
+                return least.url
+            return sticky.url
+
+    @contextmanager
+    def lease(self, url: str) -> Iterator[None]:
+        """Учитывает запрос к реплике и фиксирует его исход для проверки здоровья."""
+        endpoint = self._find(url)
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        try:
+            yield
+        except BaseException as e:
+            with self._lock:
+                endpoint.outstanding -= 1
+                if is_endpoint_error(e):
+                    self._record_failure_locked(endpoint)
+            raise
+        else:
+            with self._lock:
+                endpoint.outstanding -= 1
+                endpoint.consecutive_failures = 0
+
+    def snapshot(self) -> List[dict]:
+        """Возвращает состояние всех реплик."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": ep.url,
+                    "outstanding": ep.outstanding,
+                    "requests": ep.requests,
+                    "failures": ep.failures,
+                    "ejections": ep.ejections,
+                    "ejected": ep.ejected_until > now,
+                }
+                for ep in self._endpoints
+            ]
+
+    def _find(self, url: str) -> _Endpoint:
+        for ep in self._endpoints:
+            if ep.url == url:
+                return ep
+        raise ValueError(f"Реплика не входит в пул: {url}")
+
+    def _record_failure_locked(self, endpoint: _Endpoint) -> None:
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self._eject_failures:
+            endpoint.ejected_until = time.monotonic() + self._eject_seconds
+            endpoint.ejections += 1
+
+
+def _rendezvous_score(key: str, url: str) -> int:
+    digest = hashlib.blake2b(f"{key}|{url}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+_pools: Dict[Tuple[str, ...], EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_endpoint_pool(urls: Sequence[str]) -> EndpointPool:
+    """
+    Возвращает общий для процесса пул для набора реплик.
+
+    Пул создаётся заново при изменении списка адресов в Valves.
+
+    Args:
+        urls: Адреса реплик VLM API
+
+    Returns:
+        Пул реплик
+    """
+    key = tuple(urls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EndpointPool(key)
+        return pool
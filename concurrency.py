@@ -0,0 +1,241 @@
+"""Адаптивное ограничение параллельности запросов к VLM-серверу (AIMD)."""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from .config import (
+    VLM_AIMD_DECREASE,
+    VLM_AIMD_INCREASE,
+    VLM_CONCURRENCY_INITIAL,
+    VLM_CONCURRENCY_MAX,
+    VLM_CONCURRENCY_MIN,
+    VLM_DECREASE_COOLDOWN,
+    VLM_LATENCY_EWMA_ALPHA,
+    VLM_LATENCY_TOLERANCE,
+)
+
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+# Порядок определяет приоритет: очереди обслуживаются слева направо
+LANES: Tuple[str, ...] = (LANE_INTERACTIVE, LANE_BATCH)
+
+_Waiter = Tuple[asyncio.AbstractEventLoop, asyncio.Future]
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """
+    Проверяет, сигнализирует ли исключение о перегрузке сервера.
+
+    Перегрузкой считаются ответы 429/503 и любые таймауты.
+
+    Args:
+        exc: Исключение, возникшее при запросе к VLM
+
+    Returns:
+        True, если исключение означает перегрузку
+    """
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status in (429, 503):
+        return True
+    return "Timeout" in type(exc).__name__
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class VlmSlot:
+    """
+    Занятый слот лимитера.
+
+    `work` — объём работы запроса (по умолчанию 1); `timed_out` отмечает
+    запрос, отменённый по дедлайну, чтобы лимитер учёл его как таймаут.
+    """
+
+    __slots__ = ("work", "timed_out")
+
+    def __init__(self):
+        self.work = 1.0
+        self.timed_out = False
+
+
+class AdaptiveLimiter:
+    """
+    Ограничитель числа одновременных запросов с AIMD-регулировкой лимита.
+
+    Лимит растёт аддитивно (примерно на `increase` за «окно» из `limit`
+    успешных запросов) и уменьшается мультипликативно при 429/503/таймаутах
+    или когда задержка превышает сглаженную в `latency_tolerance` раз.
+    Задержка сравнивается в расчёте на единицу работы (`VlmSlot.work`,
+    например объём сгенерированного текста), иначе плотный тайл, который
+    просто дольше генерируется, выглядел бы признаком перегрузки.
+    Ожидающие запросы обслуживаются по приоритету очередей `LANES`.
+
+    Лимитер потокобезопасен и не привязан к event loop: `Pipeline.pipe()`
+    может вызываться из разных потоков, каждый со своим циклом.
+    """
+
+    def __init__(
+        self,
+        initial: int = VLM_CONCURRENCY_INITIAL,
+        min_limit: int = VLM_CONCURRENCY_MIN,
+        max_limit: int = VLM_CONCURRENCY_MAX,
+        increase: float = VLM_AIMD_INCREASE,
+        decrease: float = VLM_AIMD_DECREASE,
+        latency_tolerance: float = VLM_LATENCY_TOLERANCE,
+        ewma_alpha: float = VLM_LATENCY_EWMA_ALPHA,
+        cooldown: float = VLM_DECREASE_COOLDOWN,
+    ):
+        self._lock = threading.Lock()
+        self._limit = float(initial)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._increase = increase
+        self._decrease = decrease
+        self._latency_tolerance = latency_tolerance
+        self._ewma_alpha = ewma_alpha
+        self._cooldown = cooldown
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._latency: Dict[str, float] = {}
+        self._stats = {"completed": 0, "overloads": 0, "slow": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        """Текущий целочисленный лимит одновременных запросов."""
+        return max(self._min_limit, int(self._limit))
+
+    async def acquire(self, lane: str = LANE_INTERACTIVE) -> None:
+        """Ожидает свободный слот в указанной очереди приоритета."""
+        if lane not in self._queues:
+            raise ValueError(
+                f"Неизвестный приоритет запроса: {lane}. Допустимые: {', '.join(LANES)}"
+            )
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            ahead = LANES[: LANES.index(lane) + 1]
+            if self._in_flight < self.limit and not any(self._queues[l] for l in ahead):
+                self._in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._queues[lane].append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._queues[lane].remove(waiter)
+                except ValueError:
+                    # Слот уже был выдан — возвращаем его
+                    self._in_flight -= 1
+                    self._wake_locked()
+            raise
+
+    def release(self, key: str, latency: Optional[float], overloaded: bool) -> None:
+        """
+        Освобождает слот и корректирует лимит по результату запроса.
+
+        Args:
+            key: Тип запроса ("ocr", "json"); задержка сглаживается отдельно по типам
+            latency: Длительность успешного запроса в секундах на единицу работы
+                (None при ошибке)
+            overloaded: Запрос завершился сигналом перегрузки
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            self._stats["completed"] += 1
+            if overloaded:
+                self._stats["overloads"] += 1
+                self._decrease_locked(now)
+            elif latency is not None:
+                average = self._latency.get(key)
+                if average is not None and latency > average * self._latency_tolerance:
+                    self._stats["slow"] += 1
+                    self._decrease_locked(now)
+                else:
+                    self._limit = min(
+                        float(self._max_limit),
+                        self._limit + self._increase / max(self._limit, 1.0),
+                    )
+                self._latency[key] = (
+                    latency
+                    if average is None
+                    else average + (latency - average) * self._ewma_alpha
+                )
+            self._wake_locked()
+
+    @asynccontextmanager
+    async def slot(
+        self, key: str, lane: str = LANE_INTERACTIVE
+    ) -> AsyncIterator["VlmSlot"]:
+        """
+        Контекстный менеджер: занимает слот на время запроса к VLM.
+
+        Внутри блока можно задать `work` у полученного слота, чтобы задержка
+        нормировалась на объём работы запроса, и `timed_out`, если запрос
+        отменён по дедлайну.
+        """
+        await self.acquire(lane)
+        slot = VlmSlot()
+        started = time.monotonic()
+        try:
+            yield slot
+        except BaseException as e:
+            self.release(key, None, slot.timed_out or is_overload_error(e))
+            raise
+        else:
+            latency = (time.monotonic() - started) / max(slot.work, 1e-9)
+            self.release(key, latency, False)
+
+    def has_waiters(self) -> bool:
+        """Есть ли запросы, ожидающие слот."""
+        with self._lock:
+            return any(self._queues.values())
+
+    def snapshot(self) -> dict:
+        """Возвращает текущие метрики лимитера."""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queue_depth": {lane: len(q) for lane, q in self._queues.items()},
+                **self._stats,
+            }
+
+    def _decrease_locked(self, now: float) -> None:
+        # Одна волна ошибок от параллельных запросов — одно уменьшение
+        if now - self._last_decrease < self._cooldown:
+            return
+        self._limit = max(float(self._min_limit), self._limit * self._decrease)
+        self._last_decrease = now
+        self._stats["decreases"] += 1
+
+    def _wake_locked(self) -> None:
+        while self._in_flight < self.limit:
+            waiter = next((q.popleft() for q in self._queues.values() if q), None)
+            if waiter is None:
+                break
+            loop, future = waiter
+            self._in_flight += 1
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # Цикл ожидающего уже закрыт
+                self._in_flight -= 1
+
+
+# Общий для процесса лимитер: все запросы пайплайна делят один сервер
+vlm_limiter = AdaptiveLimiter()
@@ -1,9 +1,23 @@
 import os
-from typing import Final
+from typing import Final, List
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 
 VLM_API_URL: Final[str] = os.getenv("VLM_API_URL", "http://localhost:8000/v1")
+# Несколько реплик vLLM через запятую; если не задано, используется VLM_API_URL
+VLM_API_URLS: Final[List[str]] = [
+    url.strip() for url in os.getenv("VLM_API_URLS", "").split(",") if url.strip()
+]
 VLM_API_KEY: Final[str] = os.getenv("VLM_API_KEY", "token-abc")
 VLM_MODEL_NAME: Final[str] = os.getenv("VLM_MODEL_NAME", "qwen3vl-8b-instruct-fp8")
+# Очередь лимитера по умолчанию: "interactive" или "batch"
+VLM_PRIORITY: Final[str] = os.getenv("VLM_PRIORITY", "interactive")
 
 OCR_TEMPERATURE: Final[float] = 0.0
 JSON_TEMPERATURE: Final[float] = 0.0
@@ -17,3 +31,60 @@ JSON_REPETITION_PENALTY: Final[float] = 1.5
 DPI: Final[int] = 150
 MAX_TILE_SIZE: Final[int] = 4096
 TILE_OVERLAP: Final[int] = 120
+
+# Адаптивное ограничение параллельности запросов к VLM (AIMD)
+VLM_CONCURRENCY_INITIAL: Final[int] = 4
+VLM_CONCURRENCY_MIN: Final[int] = 1
+VLM_CONCURRENCY_MAX: Final[int] = 32
+VLM_AIMD_INCREASE: Final[float] = 1.0
+VLM_AIMD_DECREASE: Final[float] = 0.7
+VLM_LATENCY_TOLERANCE: Final[float] = 2.0
+VLM_LATENCY_EWMA_ALPHA: Final[float] = 0.1
+VLM_DECREASE_COOLDOWN: Final[float] = 1.0
+# Объём работы запроса = сгенерированные символы + фиксированная надбавка
+# (в символах) на префилл изображения и промпта
+VLM_LATENCY_WORK_OVERHEAD: Final[int] = 200
+
+# Балансировка между репликами VLM
+VLM_STICKY_ROUTING: Final[bool] = _env_flag("VLM_STICKY_ROUTING", True)
+VLM_STICKY_SLACK: Final[int] = 4
+VLM_EJECT_FAILURES: Final[int] = 3
+VLM_EJECT_SECONDS: Final[float] = 30.0
+VLM_MAX_ATTEMPTS: Final[int] = 3
+# Базовая пауза перед повтором (секунды); растёт вдвое с каждой попыткой,
+# фактическая пауза выбирается случайно от нуля до этого значения
+VLM_RETRY_BACKOFF: Final[float] = 0.5
+
+# Хеджирование запросов OCR и дедлайн на тайл
+VLM_HEDGE_ENABLED: Final[bool] = True
+VLM_HEDGE_PERCENTILE: Final[float] = 0.95
+VLM_HEDGE_MIN_DELAY: Final[float] = 2.0
+VLM_HEDGE_MIN_SAMPLES: Final[int] = 10
+VLM_HEDGE_WINDOW: Final[int] = 200
+VLM_HEDGE_OTHER_ENDPOINT: Final[bool] = True
+OCR_TILE_DEADLINE: Final[float] = 180.0
+
+# Потоковая генерация OCR: бюджет токенов и обрыв зацикливаний
+INK_THRESHOLD_DELTA: Final[int] = 40
+OCR_INK_PIXELS_PER_TOKEN: Final[int] = 50
+OCR_MIN_TOKENS: Final[int] = 256
+OCR_MAX_TOKENS: Final[int] = 8192
+OCR_REPEAT_MIN_SPAN: Final[int] = 600
+OCR_REPEAT_MIN_REPEATS: Final[int] = 4
+OCR_REPEAT_MAX_PERIOD: Final[int] = 300
+OCR_REPEAT_CHECK_EVERY: Final[int] = 64
+# Строки пустых таблиц («|  |  |») легитимно повторяются десятками,
+# поэтому цикл из них считается зацикливанием только на очень длинном хвосте
+OCR_REPEAT_TABLE_MIN_SPAN: Final[int] = 6000
+OCR_RETRY_PRESENCE_PENALTY: Final[float] = 0.5
+OCR_RETRY_REPETITION_PENALTY: Final[float] = 1.1
+
+# Пропуск пустых тайлов и обрезка по содержимому
+TILE_BLANK_INK_RATIO: Final[float] = 0.001
+TILE_BLANK_MIN_STD: Final[float] = 3.0
+TILE_MIN_LINE_INK: Final[int] = 3
+TILE_CROP_PADDING: Final[int] = 16
+
+# Прогрев VLM при запуске пайплайна
+VLM_WARMUP: Final[bool] = _env_flag("VLM_WARMUP", False)
+VLM_WARMUP_TIMEOUT: Final[float] = 30.0
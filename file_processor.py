@@ -3,14 +3,29 @@
 import base64
 from io import BytesIO
 from pathlib import Path
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
 
-import fitz
-from docx import Document
 from PIL import Image
 
-from .config import DPI, MAX_TILE_SIZE, TILE_OVERLAP
-from .image_enhancer import enhance_scan_for_ocr
+from .config import (
+    DPI,
+    MAX_TILE_SIZE,
+    TILE_BLANK_INK_RATIO,
+    TILE_BLANK_MIN_STD,
+    TILE_CROP_PADDING,
+    TILE_OVERLAP,
+)
+from .image_enhancer import analyze_content, enhance_scan_for_ocr
+from .lazy_imports import lazy_import
+
+
+class ImageTile(NamedTuple):
+    """Тайл, готовый к отправке в VLM."""
+
+    b64: str
+    width: int
+    height: int
+    ink_ratio: float
 
 
 class FileProcessor:
@@ -99,16 +114,20 @@ class FileProcessor:
         return "unknown"
 
     @staticmethod
-    def extract_images_from_pdf(pdf_path: str) -> List[str]:
+    def extract_images_from_pdf(
+        pdf_path: str, stats: Optional[dict] = None
+    ) -> List[ImageTile]:
         """
         Извлекает и тайлит изображения из PDF.
 
         Args:
             pdf_path: Путь к PDF файлу
+            stats: Словарь для счётчиков пропущенных и обрезанных тайлов
 
         Returns:
-            Список base64-строк изображений
+            Список тайлов изображений
         """
+        fitz = lazy_import("fitz")
         b64_tiles = []
         matrix = fitz.Matrix(DPI / 72.0, DPI / 72.0)
 
@@ -124,26 +143,31 @@ class FileProcessor:
                 tiles = FileProcessor._tile_image(img)
 
                 for tile in tiles:
-                    b64 = FileProcessor._image_to_base64(tile)
-                    b64_tiles.append(b64)
+                    tile = FileProcessor._make_tile(tile, stats)
+                    if tile is not None:
+                        b64_tiles.append(tile)
 
         return b64_tiles
 
     @staticmethod
-    def extract_images_from_docx(docx_path: str) -> List[str]:
+    def extract_images_from_docx(
+        docx_path: str, stats: Optional[dict] = None
+    ) -> List[ImageTile]:
         """
         Извлекает изображения из Word документа.
 
         Args:
             docx_path: Путь к DOCX файлу
+            stats: Словарь для счётчиков пропущенных и обрезанных тайлов
 
         Returns:
-            Список base64-строк изображений
+            Список тайлов изображений
         """
         b64_images = []
+        decoded = 0
 
         try:
-            doc = Document(docx_path)
+            doc = lazy_import("docx").Document(docx_path)
 
             # Извлекаем изображения из всех частей документа
             # DOCX хранит изображения в relationships документа
@@ -188,12 +212,14 @@ class FileProcessor:
 
                     # Улучшаем для OCR
                     img = enhance_scan_for_ocr(img)
+                    decoded += 1
 
                     # Тайлим если нужно
                     tiles = FileProcessor._tile_image(img)
                     for tile in tiles:
-                        b64 = FileProcessor._image_to_base64(tile)
-                        b64_images.append(b64)
+                        tile = FileProcessor._make_tile(tile, stats)
+                        if tile is not None:
+                            b64_images.append(tile)
                 except Exception:
                     # Пропускаем невалидные изображения
                     continue
@@ -201,21 +227,25 @@ class FileProcessor:
         except Exception as e:
             raise ValueError(f"Ошибка при извлечении изображений из DOCX: {e}")
 
-        if not b64_images:
+        # Пустой список без ошибки: изображения есть, но без содержимого
+        if not decoded:
             raise ValueError("В DOCX документе не найдено изображений")
 
         return b64_images
 
     @staticmethod
-    def process_image(image_bytes: bytes) -> List[str]:
+    def process_image(
+        image_bytes: bytes, stats: Optional[dict] = None
+    ) -> List[ImageTile]:
         """
         Обрабатывает изображение: улучшает и тайлит при необходимости.
 
         Args:
             image_bytes: Байты изображения
+            stats: Словарь для счётчиков пропущенных и обрезанных тайлов
 
         Returns:
-            Список base64-строк изображений
+            Список тайлов изображений
         """
         try:
             img = Image.open(BytesIO(image_bytes))
@@ -230,8 +260,9 @@ class FileProcessor:
 
             b64_images = []
             for tile in tiles:
-                b64 = FileProcessor._image_to_base64(tile)
-                b64_images.append(b64)
+                tile = FileProcessor._make_tile(tile, stats)
+                if tile is not None:
+                    b64_images.append(tile)
 
             return b64_images
         except Exception as e:
@@ -277,6 +308,63 @@ class FileProcessor:
 
         return tiles
 
+    @staticmethod
+    def _make_tile(
+        img: Image.Image, stats: Optional[dict] = None
+    ) -> Optional[ImageTile]:
+        """
+        Отсеивает пустой тайл или обрезает его по содержимому и кодирует.
+
+        Тайл без текста (почти нет «чернильных» пикселей или яркость почти
+        однородна) не отправляется в VLM. Остальные обрезаются по рамке
+        содержимого, что уменьшает размер запроса и число визуальных токенов.
+        Если фон определить не удалось (например, тёмный скан), тайл
+        отправляется целиком.
+
+        Args:
+            img: PIL Image объект
+            stats: Словарь для счётчиков tiles_skipped, tiles_cropped, pixels_saved
+
+        Returns:
+            Тайл с base64-строкой, размерами и долей «чернильных» пикселей
+            или None, если тайл пустой
+        """
+        if stats is None:
+            stats = {}
+        for key in ("tiles_skipped", "tiles_cropped", "pixels_saved"):
+            stats.setdefault(key, 0)
+
+        width, height = img.size
+        bbox, ink_pixels, std = analyze_content(img)
+        if (
+            std < TILE_BLANK_MIN_STD
+            or ink_pixels < width * height * TILE_BLANK_INK_RATIO
+        ):
+            stats["tiles_skipped"] += 1
+            stats["pixels_saved"] += width * height
+            return None
+
+        box = (0, 0, width, height)
+        if bbox is not None:
+            left, top, right, bottom = bbox
+            box = (
+                max(0, left - TILE_CROP_PADDING),
+                max(0, top - TILE_CROP_PADDING),
+                min(width, right + TILE_CROP_PADDING),
+                min(height, bottom + TILE_CROP_PADDING),
+            )
+        if box != (0, 0, width, height):
+            img = img.crop(box)
+            stats["tiles_cropped"] += 1
+            stats["pixels_saved"] += width * height - img.width * img.height
+
+        return ImageTile(
+            FileProcessor._image_to_base64(img),
+            img.width,
+            img.height,
+            min(1.0, ink_pixels / (img.width * img.height)),
+        )
+
     @staticmethod
     def _image_to_base64(img: Image.Image) -> str:
         """
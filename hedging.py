@@ -0,0 +1,210 @@
+"""Хеджирование медленных запросов к VLM и дедлайны на запрос."""
+
+import asyncio
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+from .config import (
+    VLM_HEDGE_ENABLED,
+    VLM_HEDGE_MIN_DELAY,
+    VLM_HEDGE_MIN_SAMPLES,
+    VLM_HEDGE_PERCENTILE,
+    VLM_HEDGE_WINDOW,
+)
+
+T = TypeVar("T")
+
+
+def _consume_result(task: asyncio.Future) -> None:
+    # Исход отменённого проигравшего не нужен, но должен быть извлечён
+    if not task.cancelled():
+        task.exception()
+
+
+class Hedger:
+    """
+    Запускает дублирующий запрос, если основной выполняется слишком долго.
+
+    Задержки запоминаются в расчёте на единицу работы запроса (для тайла —
+    токен бюджета `max_tokens`). Порог хеджирования — перцентиль `percentile`
+    таких задержек последних `window` успешных запросов, умноженный на объём
+    работы текущего запроса, но не меньше `min_delay` секунд. Иначе самые
+    плотные тайлы дублировались бы всегда, хотя дубль при нулевой температуре
+    повторяет ту же долгую генерацию. Пока накоплено меньше `min_samples`
+    замеров, дубли не отправляются. Из двух запросов берётся первый успешно
+    завершившийся, второй отменяется.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = VLM_HEDGE_ENABLED,
+        percentile: float = VLM_HEDGE_PERCENTILE,
+        min_delay: float = VLM_HEDGE_MIN_DELAY,
+        min_samples: int = VLM_HEDGE_MIN_SAMPLES,
+        window: int = VLM_HEDGE_WINDOW,
+    ):
+        self._lock = threading.Lock()
+        self._enabled = enabled
+        self._percentile = percentile
+        self._min_delay = min_delay
+        self._min_samples = min_samples
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._stats = {
+            "hedged": 0,
+            "hedge_skipped": 0,
+            "hedge_wins": 0,
+            "primary_wins": 0,
+            "deadline_exceeded": 0,
+        }
+
+    def threshold(self, work: float = 1.0) -> Optional[float]:
+        """
+        Порог хеджирования в секундах для запроса объёмом `work`.
+
+        Args:
+            work: Объём работы запроса
+
+        Returns:
+            Порог в секундах или None, если хеджирование выключено
+        """
+        with self._lock:
+            per_unit = self._threshold_locked()
+        if per_unit is None:
+            return None
+        return max(self._min_delay, per_unit * work)
+
+    async def run(
+        self,
+        call: Callable[[bool, Callable[[], None]], Awaitable[T]],
+        deadline: Optional[float] = None,
+        can_hedge: Optional[Callable[[], bool]] = None,
+        on_deadline: Optional[Callable[[], None]] = None,
+        work: float = 1.0,
+    ) -> T:
+        """
+        Выполняет запрос с хеджированием и дедлайном.
+
+        Порог хеджирования и дедлайн отсчитываются не от вызова, а от момента,
+        когда основной запрос реально отправлен (получил слот лимитера и
+        реплику): ожидание в очереди не считается медленной работой и не
+        попадает в замеры задержек.
+
+        Args:
+            call: Фабрика запроса; аргументы — True для дублирующего запроса и
+                колбэк, который запрос вызывает в момент отправки
+            deadline: Максимальное время выполнения в секундах (None — без ограничения)
+            can_hedge: Проверка, допустим ли дубль сейчас (например, нет очереди)
+            on_deadline: Вызывается при срыве дедлайна до отмены запросов
+            work: Объём работы запроса, например бюджет токенов тайла
+
+        Returns:
+            Результат первого успешно завершившегося запроса
+
+        Raises:
+            asyncio.TimeoutError: Ни один запрос не уложился в дедлайн
+        """
+        loop = asyncio.get_running_loop()
+        dispatched = asyncio.Event()
+        started: Optional[float] = None
+
+        def on_dispatch() -> None:
+            nonlocal started
+            if started is None:
+                started = loop.time()
+                dispatched.set()
+
+        primary = asyncio.ensure_future(call(False, on_dispatch))
+        hedge: Optional[asyncio.Future] = None
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            # Пока основной запрос стоит в очереди, часы не идут
+            waiter = asyncio.ensure_future(dispatched.wait())
+            try:
+                await asyncio.wait(
+                    {primary, waiter}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                waiter.cancel()
+            if started is None:
+                pending = set()
+                return primary.result()
+
+            delay = self.threshold(work)
+            stop_at = started + deadline if deadline else None
+            hedge_at = started + delay if delay is not None else None
+
+            while pending:
+                wake_at = [
+                    t
+                    for t in (stop_at, hedge_at if hedge is None else None)
+                    if t is not None
+                ]
+                timeout = max(0.0, min(wake_at) - loop.time()) if wake_at else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        latency = (loop.time() - started) / max(work, 1e-9)
+                        self._record(latency, hedge, task is hedge)
+                        return task.result()
+                    error = task.exception()
+                if done:
+                    continue
+                if hedge is None and hedge_at is not None and loop.time() >= hedge_at:
+                    hedge_at = None
+                    if can_hedge is not None and not can_hedge():
+                        # Сервер насыщен: дубль лишь удвоит очередь
+                        with self._lock:
+                            self._stats["hedge_skipped"] += 1
+                        continue
+                    hedge = asyncio.ensure_future(call(True, lambda: None))
+                    pending.add(hedge)
+                    with self._lock:
+                        self._stats["hedged"] += 1
+                    continue
+                if stop_at is None or loop.time() < stop_at:
+                    # Таймер сработал раньше срока: ни дубль, ни дедлайн не наступили
+                    continue
+                with self._lock:
+                    self._stats["deadline_exceeded"] += 1
+                if on_deadline is not None:
+                    on_deadline()
+                raise asyncio.TimeoutError(
+                    f"Запрос к VLM не уложился в дедлайн {deadline:g} с"
+                )
+            raise error
+        finally:
+            for task in pending:
+                task.add_done_callback(_consume_result)
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        """Возвращает порог на единицу работы и счётчики хеджирования."""
+        with self._lock:
+            return {
+                "threshold": self._threshold_locked(),
+                "samples": len(self._latencies),
+                **self._stats,
+            }
+
+    def _threshold_locked(self) -> Optional[float]:
+        if not self._enabled or len(self._latencies) < self._min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self._percentile * len(ordered)))
+        return ordered[index]
+
+    def _record(
+        self, latency: float, hedge: Optional[asyncio.Future], hedge_won: bool
+    ) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            if hedge is not None:
+                self._stats["hedge_wins" if hedge_won else "primary_wins"] += 1
+
+
+# Общий для процесса хеджер тайлов OCR: порог считается по всем документам
+ocr_hedger = Hedger()
@@ -1,9 +1,14 @@
-import cv2
+from typing import Optional, Tuple
+
 import numpy as np
 from PIL import Image
 
+from .config import INK_THRESHOLD_DELTA, TILE_MIN_LINE_INK
+from .lazy_imports import lazy_import
+
 
 def enhance_scan_for_ocr(pil_img: Image.Image) -> Image.Image:
+    cv2 = lazy_import("cv2")
     img_np = np.array(pil_img)
     if img_np.ndim == 3:
         gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
@@ -18,3 +23,38 @@ def enhance_scan_for_ocr(pil_img: Image.Image) -> Image.Image:
     enhanced = clahe.apply(normalized)
     result_rgb = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2RGB)
     return Image.fromarray(result_rgb)
+
+
+def analyze_content(
+    pil_img: Image.Image,
+    delta: int = INK_THRESHOLD_DELTA,
+    min_line_ink: int = TILE_MIN_LINE_INK,
+) -> Tuple[Optional[Tuple[int, int, int, int]], int, float]:
+    # Рамка содержимого по «чернильным» пикселям (заметно темнее медианного
+    # фона), их число и СКО яркости. Всё считается по гистограмме и проекциям
+    # маски на оси, без попиксельных циклов. Рамка None — содержимое не
+    # локализовано, тайл не обрезается.
+    gray = np.asarray(pil_img.convert("L"))
+    if gray.size == 0:
+        return None, 0, 0.0
+
+    hist = np.bincount(gray.ravel(), minlength=256)
+    levels = np.arange(256)
+    mean = hist @ levels / gray.size
+    std = float(np.sqrt(hist @ (levels - mean) ** 2 / gray.size))
+
+    cdf = np.cumsum(hist)
+    threshold = int(np.searchsorted(cdf, gray.size / 2)) - delta
+    if threshold <= 0:
+        # Фон слишком тёмный, чтобы отделить «чернила»: считаем весь тайл
+        # содержимым, а решение о пустоте оставляем проверке СКО
+        return (0, 0, gray.shape[1], gray.shape[0]), gray.size, std
+    ink_pixels = int(cdf[threshold - 1])
+
+    ink = gray < threshold
+    rows = np.flatnonzero(np.count_nonzero(ink, axis=1) >= min_line_ink)
+    cols = np.flatnonzero(np.count_nonzero(ink, axis=0) >= min_line_ink)
+    if rows.size == 0 or cols.size == 0:
+        return None, ink_pixels, std
+    bbox = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+    return bbox, ink_pixels, std
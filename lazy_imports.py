@@ -0,0 +1,42 @@
+"""Отложенный импорт тяжёлых зависимостей и учёт времени импорта."""
+
+import importlib
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict
+
+_lock = threading.Lock()
+_import_times: Dict[str, float] = {}
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Импортирует модуль при первом обращении и запоминает длительность импорта.
+
+    Args:
+        name: Полное имя модуля, например "fitz" или "langchain_openai"
+
+    Returns:
+        Импортированный модуль
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    record_import_time(name, time.perf_counter() - started)
+    return module
+
+
+def record_import_time(name: str, seconds: float) -> None:
+    """Сохраняет длительность импорта или инициализации под именем `name`."""
+    with _lock:
+        _import_times.setdefault(name, seconds)
+
+
+def import_report() -> Dict[str, float]:
+    """Возвращает длительности импортов в секундах в порядке их выполнения."""
+    with _lock:
+        return {name: round(seconds, 4) for name, seconds in _import_times.items()}
@@ -2,31 +2,72 @@
 
 import asyncio
 import base64
+import hashlib
 import json
 import os
+import random
 import tempfile
+import time
 from pathlib import Path
-from typing import Generator, Iterator, List, Union
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    TYPE_CHECKING,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
+from .balancer import EndpointPool, get_endpoint_pool, is_endpoint_error
+from .concurrency import LANE_INTERACTIVE, vlm_limiter
 from .config import (
     JSON_PRESENCE_PENALTY,
     JSON_REPETITION_PENALTY,
     JSON_TEMPERATURE,
     OCR_PRESENCE_PENALTY,
     OCR_REPETITION_PENALTY,
+    OCR_RETRY_PRESENCE_PENALTY,
+    OCR_RETRY_REPETITION_PENALTY,
     OCR_TEMPERATURE,
+    OCR_TILE_DEADLINE,
     VLM_API_KEY,
     VLM_API_URL,
+    VLM_API_URLS,
+    VLM_HEDGE_OTHER_ENDPOINT,
+    VLM_LATENCY_WORK_OVERHEAD,
+    VLM_MAX_ATTEMPTS,
     VLM_MODEL_NAME,
+    VLM_PRIORITY,
+    VLM_RETRY_BACKOFF,
+    VLM_STICKY_ROUTING,
+    VLM_WARMUP,
+    VLM_WARMUP_TIMEOUT,
 )
-from .file_processor import FileProcessor
+from .file_processor import FileProcessor, ImageTile
+from .hedging import ocr_hedger
+from .lazy_imports import import_report, lazy_import
 from .markdown_postproc import fix_ocr_markdown, remove_parentheses_around_numbers
-from .prompts import FRAGMENT_PROMPT, SYSTEM_PROMPT_JSON, SYSTEM_PROMPT_MD
+from .prompts import FRAGMENT_PROMPT, SYSTEM_PROMPT_MD, get_system_prompt_json
 from .schemas import parser
+from .streaming import (
+    STOP_REPETITION,
+    OcrResult,
+    estimate_token_budget,
+    stream_ocr,
+)
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+T = TypeVar("T")
 
 
 class Pipeline:
@@ -34,25 +75,36 @@ class Pipeline:
 
     class Valves(BaseModel):
         VLM_API_URL: str
+        VLM_API_URLS: List[str] = []
         VLM_API_KEY: str
         VLM_MODEL_NAME: str
+        VLM_PRIORITY: str = VLM_PRIORITY
+        VLM_STICKY_ROUTING: bool = VLM_STICKY_ROUTING
+        VLM_WARMUP: bool = VLM_WARMUP
 
     def __init__(self):
         self.name = "OCR Pipeline"
         self.file_processor = FileProcessor()
+        self._llm_cache: Dict[Tuple[str, str, str, str], "ChatOpenAI"] = {}
+        self.warmup_report: Optional[dict] = None
 
         self.valves = self.Valves(
             **{
                 "pipelines": ["*"],
                 "VLM_API_URL": os.getenv("VLM_API_URL", VLM_API_URL),
+                "VLM_API_URLS": VLM_API_URLS,
                 "VLM_API_KEY": os.getenv("VLM_API_KEY", VLM_API_KEY),
                 "VLM_MODEL_NAME": os.getenv("VLM_MODEL_NAME", VLM_MODEL_NAME),
+                "VLM_PRIORITY": VLM_PRIORITY,
+                "VLM_STICKY_ROUTING": VLM_STICKY_ROUTING,
+                "VLM_WARMUP": VLM_WARMUP,
             }
         )
 
     async def on_startup(self):
-        """Вызывается при запуске пайплайна."""
-        pass
+        """Вызывается при запуске пайплайна; при VLM_WARMUP прогревает VLM."""
+        if self.valves.VLM_WARMUP:
+            self.warmup_report = await self._warm_up()
 
     async def on_shutdown(self):
         """Вызывается при остановке пайплайна."""
@@ -66,19 +118,174 @@ class Pipeline:
         else:
             return base64.b64decode(file_data_b64)
 
-    async def _invoke_vlm_ocr(self, b64_images: List[str]) -> str:
-        """Асинхронно выполняет OCR через VLM и возвращает Markdown."""
-        llm = ChatOpenAI(
-            base_url=self.valves.VLM_API_URL,
-            api_key=self.valves.VLM_API_KEY,
-            model=self.valves.VLM_MODEL_NAME,
-            temperature=OCR_TEMPERATURE,
-            presence_penalty=OCR_PRESENCE_PENALTY,
-            extra_body={"repetition_penalty": OCR_REPETITION_PENALTY},
-        )
+    async def _warm_up(self) -> dict:
+        """
+        Создаёт клиенты и отправляет на каждую реплику короткие запросы с
+        системными промптами, чтобы они попали в prefix-кэш сервера.
+
+        Запросы идут в обход vlm_limiter, чтобы не искажать статистику задержек.
+        Ошибки прогрева не прерывают запуск и возвращаются в отчёте.
+        """
+        started = time.perf_counter()
+        prompts = {
+            "ocr": [
+                SystemMessage(content=SYSTEM_PROMPT_MD),
+                HumanMessage(content=[{"type": "text", "text": FRAGMENT_PROMPT}]),
+            ],
+            "json": [
+                SystemMessage(content=get_system_prompt_json()),
+                HumanMessage(content=[{"type": "text", "text": "-"}]),
+            ],
+        }
+        targets = [
+            (kind, url)
+            for url in self.valves.VLM_API_URLS or [self.valves.VLM_API_URL]
+            for kind in prompts
+        ]
 
-        all_md = []
-        for b64 in b64_images:
+        async def warm(kind: str, url: str) -> None:
+            # Клиент создаётся внутри корутины: ошибки импорта и конструктора
+            # попадают в отчёт, а не прерывают запуск
+            await self._get_llm(kind, url).ainvoke(prompts[kind], max_tokens=1)
+
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    *(warm(kind, url) for kind, url in targets),
+                    return_exceptions=True,
+                ),
+                VLM_WARMUP_TIMEOUT,
+            )
+            errors = [
+                f"{kind} {url}: {result}"
+                for (kind, url), result in zip(targets, results)
+                if isinstance(result, Exception)
+            ]
+        except asyncio.TimeoutError:
+            errors = [f"Прогрев не завершился за {VLM_WARMUP_TIMEOUT:g} с"]
+
+        return {
+            "seconds": round(time.perf_counter() - started, 3),
+            "requests": len(targets),
+            "errors": errors,
+        }
+
+    def _endpoint_pool(self) -> EndpointPool:
+        """Возвращает пул реплик VLM согласно текущим Valves."""
+        return get_endpoint_pool(self.valves.VLM_API_URLS or [self.valves.VLM_API_URL])
+
+    def _get_llm(self, kind: str, base_url: str) -> "ChatOpenAI":
+        """Возвращает (с кэшированием) клиент VLM для этапа `kind` и реплики."""
+        key = (kind, base_url, self.valves.VLM_API_KEY, self.valves.VLM_MODEL_NAME)
+        llm = self._llm_cache.get(key)
+        if llm is None:
+            if kind == "ocr":
+                temperature, presence, repetition = (
+                    OCR_TEMPERATURE,
+                    OCR_PRESENCE_PENALTY,
+                    OCR_REPETITION_PENALTY,
+                )
+            else:
+                temperature, presence, repetition = (
+                    JSON_TEMPERATURE,
+                    JSON_PRESENCE_PENALTY,
+                    JSON_REPETITION_PENALTY,
+                )
+            llm = lazy_import("langchain_openai").ChatOpenAI(
+                base_url=base_url,
+                api_key=self.valves.VLM_API_KEY,
+                model=self.valves.VLM_MODEL_NAME,
+                temperature=temperature,
+                presence_penalty=presence,
+                extra_body={"repetition_penalty": repetition},
+                # Повторы делают vlm_limiter и пул реплик: внутренние повторы SDK
+                # скрыли бы от них 429/503 и таймауты
+                max_retries=0,
+            )
+            self._llm_cache[key] = llm
+        return llm
+
+    async def _call_vlm(
+        self,
+        kind: str,
+        request: Callable[["ChatOpenAI"], Awaitable[T]],
+        lane: str = LANE_INTERACTIVE,
+        sticky_key: Optional[str] = None,
+        routed: Optional[List[str]] = None,
+        on_dispatch: Optional[Callable[[], None]] = None,
+        work: Optional[Callable[[T], float]] = None,
+        timed_out: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        Выполняет запрос `request(llm)` через общий лимитер и пул реплик.
+
+        При ошибке реплики (перегрузка, 5xx, обрыв соединения) запрос
+        повторяется после паузы с джиттером, по возможности на другой реплике,
+        не более VLM_MAX_ATTEMPTS попыток (в том числе при единственной реплике).
+        Реплики из `routed` не выбираются, пока есть другие; выбранные
+        реплики дописываются в этот список. `on_dispatch` вызывается, когда
+        запрос получил слот лимитера и реплику и уходит на сервер.
+        `work(result)` оценивает объём работы запроса, на который лимитер
+        нормирует задержку. `timed_out()` сообщает, что запрос отменён по
+        дедлайну: лимитер учитывает такую отмену как таймаут.
+        """
+        pool = self._endpoint_pool()
+        if not self.valves.VLM_STICKY_ROUTING:
+            sticky_key = None
+        if routed is None:
+            routed = []
+
+        for attempt in range(1, VLM_MAX_ATTEMPTS + 1):
+            async with vlm_limiter.slot(kind, lane) as slot:
+                url = pool.pick(sticky_key, exclude=routed)
+                routed.append(url)
+                if on_dispatch is not None:
+                    on_dispatch()
+                try:
+                    with pool.lease(url):
+                        result = await request(self._get_llm(kind, url))
+                    if work is not None:
+                        slot.work = work(result)
+                    return result
+                except asyncio.CancelledError:
+                    if timed_out is not None and timed_out():
+                        slot.timed_out = True
+                    raise
+                except Exception as e:
+                    if not is_endpoint_error(e) or attempt >= VLM_MAX_ATTEMPTS:
+                        raise
+            # Пауза вне слота лимитера; джиттер разводит повторы тайлов,
+            # одновременно получивших 429/503
+            await asyncio.sleep(
+                random.uniform(0, VLM_RETRY_BACKOFF * 2 ** (attempt - 1))
+            )
+
+    async def _invoke_vlm_ocr(
+        self,
+        tiles: List[ImageTile],
+        lane: str = LANE_INTERACTIVE,
+        sticky_key: Optional[str] = None,
+        stats: Optional[dict] = None,
+    ) -> str:
+        """
+        Асинхронно выполняет OCR через VLM и возвращает Markdown.
+
+        Генерация идёт потоком с бюджетом токенов по площади и плотности
+        текста тайла; зациклившаяся генерация обрывается и повторяется один
+        раз с усиленными штрафами. Зависшие тайлы хеджируются дублирующим
+        запросом, а тайлы, не уложившиеся в OCR_TILE_DEADLINE, пропускаются.
+        Обрывы и пропуски учитываются в `stats`.
+        """
+        if stats is None:
+            stats = {}
+        stats.setdefault("tiles_timed_out", 0)
+        stats.setdefault("repetition_aborts", 0)
+        stats.setdefault("truncated_tiles", [])
+
+        def ocr_work(result: OcrResult) -> float:
+            return VLM_LATENCY_WORK_OVERHEAD + result.generated
+
+        async def ocr_tile(index: int, tile: ImageTile) -> str:
             messages = [
                 SystemMessage(content=SYSTEM_PROMPT_MD),
                 HumanMessage(
@@ -86,35 +293,106 @@ class Pipeline:
                         {"type": "text", "text": FRAGMENT_PROMPT},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{b64}"},
+                            "image_url": {"url": f"data:image/jpeg;base64,{tile.b64}"},
                         },
                     ]
                 ),
             ]
-            resp = await llm.ainvoke(messages)
-            cleaned = fix_ocr_markdown(resp.content.strip())
-            all_md.append(cleaned)
+            max_tokens = estimate_token_budget(tile.width, tile.height, tile.ink_ratio)
+
+            async def attempt(**kwargs) -> OcrResult:
+                routed: List[str] = []
+                expired = asyncio.Event()
+
+                def request(
+                    llm: "ChatOpenAI",
+                ) -> Awaitable[OcrResult]:
+                    return stream_ocr(llm, messages, max_tokens, **kwargs)
+
+                async def call(
+                    is_hedge: bool, on_dispatch: Callable[[], None]
+                ) -> OcrResult:
+                    if not is_hedge:
+                        return await self._call_vlm(
+                            "ocr",
+                            request,
+                            lane,
+                            sticky_key,
+                            routed,
+                            on_dispatch,
+                            ocr_work,
+                            expired.is_set,
+                        )
+                    # Дубль уходит на другую реплику, если она есть
+                    exclude = list(routed) if VLM_HEDGE_OTHER_ENDPOINT else []
+                    return await self._call_vlm(
+                        "ocr",
+                        request,
+                        lane,
+                        None,
+                        exclude,
+                        on_dispatch,
+                        ocr_work,
+                        expired.is_set,
+                    )
 
-        return "\n\n".join(md for md in all_md if md)
+                # Дубли не отправляются, пока в лимитере есть очередь
+                return await ocr_hedger.run(
+                    call,
+                    OCR_TILE_DEADLINE,
+                    can_hedge=lambda: not vlm_limiter.has_waiters(),
+                    on_deadline=expired.set,
+                    work=max_tokens,
+                )
 
-    async def _invoke_vlm_json(self, markdown_text: str) -> dict:
-        """Асинхронно преобразует Markdown в JSON через VLM."""
-        llm = ChatOpenAI(
-            base_url=self.valves.VLM_API_URL,
-            api_key=self.valves.VLM_API_KEY,
-            model=self.valves.VLM_MODEL_NAME,
-            temperature=JSON_TEMPERATURE,
-            presence_penalty=JSON_PRESENCE_PENALTY,
-            extra_body={"repetition_penalty": JSON_REPETITION_PENALTY},
+            try:
+                text, stop_reason, _ = await attempt()
+            except asyncio.TimeoutError:
+                stats["tiles_timed_out"] += 1
+                return ""
+
+            if stop_reason == STOP_REPETITION:
+                stats["repetition_aborts"] += 1
+                try:
+                    text, stop_reason, _ = await attempt(
+                        presence_penalty=OCR_RETRY_PRESENCE_PENALTY,
+                        extra_body={"repetition_penalty": OCR_RETRY_REPETITION_PENALTY},
+                    )
+                except asyncio.TimeoutError:
+                    # Остаётся свёрнутый текст первой попытки с пометкой об обрыве
+                    pass
+
+            if stop_reason is not None:
+                stats["truncated_tiles"].append({"tile": index, "reason": stop_reason})
+            return fix_ocr_markdown(text.strip())
+
+        # Тайлы отправляются параллельно, фактическую нагрузку ограничивает vlm_limiter
+        all_md = await asyncio.gather(
+            *(ocr_tile(index, tile) for index, tile in enumerate(tiles))
         )
 
+        return "\n\n".join(md for md in all_md if md)
+
+    async def _invoke_vlm_json(
+        self,
+        markdown_text: str,
+        lane: str = LANE_INTERACTIVE,
+        sticky_key: Optional[str] = None,
+    ) -> dict:
+        """Асинхронно преобразует Markdown в JSON через VLM."""
         cleaned_md = remove_parentheses_around_numbers(markdown_text)
         messages = [
-            SystemMessage(content=SYSTEM_PROMPT_JSON),
+            SystemMessage(content=get_system_prompt_json()),
             HumanMessage(content=[{"type": "text", "text": cleaned_md}]),
         ]
 
-        response = await llm.ainvoke(messages)
+        response = await self._call_vlm(
+            "json",
+            lambda llm: llm.ainvoke(messages),
+            lane,
+            sticky_key,
+            work=lambda r: VLM_LATENCY_WORK_OVERHEAD + len(r.content),
+        )
 
         try:
             parsed = parser.parse(response.content)
@@ -139,31 +417,39 @@ class Pipeline:
         return enriched
 
     def _extract_images(
-        self, file_bytes: bytes, file_type: str, filename: str = None
-    ) -> List[str]:
+        self,
+        file_bytes: bytes,
+        file_type: str,
+        filename: str = None,
+        stats: Optional[dict] = None,
+    ) -> List[ImageTile]:
         """Извлекает изображения из файла в зависимости от его типа."""
         if file_type == "pdf":
-            return self._extract_from_pdf(file_bytes)
+            return self._extract_from_pdf(file_bytes, stats)
         elif file_type == "docx":
-            return self._extract_from_docx(file_bytes, filename)
+            return self._extract_from_docx(file_bytes, filename, stats)
         elif file_type == "image":
-            return self.file_processor.process_image(file_bytes)
+            return self.file_processor.process_image(file_bytes, stats)
         else:
             raise ValueError(f"Неподдерживаемый тип файла: {file_type}")
 
-    def _extract_from_pdf(self, file_bytes: bytes) -> List[str]:
+    def _extract_from_pdf(
+        self, file_bytes: bytes, stats: Optional[dict] = None
+    ) -> List[ImageTile]:
         """Извлекает изображения из PDF файла."""
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
             tmp.write(file_bytes)
             tmp_path = tmp.name
 
         try:
-            return self.file_processor.extract_images_from_pdf(tmp_path)
+            return self.file_processor.extract_images_from_pdf(tmp_path, stats)
         finally:
             if os.path.exists(tmp_path):
                 os.unlink(tmp_path)
 
-    def _extract_from_docx(self, file_bytes: bytes, filename: str = None) -> List[str]:
+    def _extract_from_docx(
+        self, file_bytes: bytes, filename: str = None, stats: Optional[dict] = None
+    ) -> List[ImageTile]:
         """Извлекает изображения из DOCX файла."""
         if filename:
             suffix = Path(filename).suffix.lower()
@@ -177,12 +463,14 @@ class Pipeline:
             tmp_path = tmp.name
 
         try:
-            return self.file_processor.extract_images_from_docx(tmp_path)
+            return self.file_processor.extract_images_from_docx(tmp_path, stats)
         finally:
             if os.path.exists(tmp_path):
                 os.unlink(tmp_path)
 
-    async def _process_file(self, file_bytes: bytes, filename: str = None) -> dict:
+    async def _process_file(
+        self, file_bytes: bytes, filename: str = None, lane: str = LANE_INTERACTIVE
+    ) -> dict:
         """Обрабатывает файл через двухэтапный OCR пайплайн."""
         # Определение типа файла и извлечение изображений
         file_type = self.file_processor.detect_file_type(file_bytes, filename)
@@ -192,16 +480,24 @@ class Pipeline:
                 "error": "Неподдерживаемый тип файла. Поддерживаются: PDF, DOCX, изображения (JPG, PNG, GIF, BMP, TIFF, WEBP)"
             }
 
-        # Извлечение изображений
-        b64_images = self._extract_images(file_bytes, file_type, filename)
+        # Извлечение изображений (пустые тайлы отсеиваются сразу)
+        ocr_stats: dict = {}
+        tiles = self._extract_images(file_bytes, file_type, filename, ocr_stats)
 
-        if not b64_images:
+        if not tiles and ocr_stats.get("tiles_skipped"):
+            return {
+                "error": "OCR не вернул результатов. Возможно, изображения не содержат читаемого текста."
+            }
+        if not tiles:
             return {
                 "error": "Не удалось извлечь изображения из файла. Убедитесь, что файл содержит изображения или сканы документов."
             }
 
+        # Страницы одного документа направляются на одну реплику (prefix-кэш)
+        sticky_key = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+
         # OCR → Markdown
-        markdown_result = await self._invoke_vlm_ocr(b64_images)
+        markdown_result = await self._invoke_vlm_ocr(tiles, lane, sticky_key, ocr_stats)
 
         if not markdown_result or not markdown_result.strip():
             return {
@@ -209,7 +505,14 @@ class Pipeline:
             }
 
         # Markdown → JSON
-        final_json = await self._invoke_vlm_json(markdown_result)
+        final_json = await self._invoke_vlm_json(markdown_result, lane, sticky_key)
+        final_json["metrics"] = {
+            "ocr": ocr_stats,
+            "vlm_limiter": vlm_limiter.snapshot(),
+            "vlm_endpoints": self._endpoint_pool().snapshot(),
+            "vlm_hedging": ocr_hedger.snapshot(),
+            "startup": {"imports": import_report(), "warmup": self.warmup_report},
+        }
 
         return final_json
 
@@ -242,6 +545,9 @@ class Pipeline:
             if not file_data_b64:
                 return "Ошибка: данные файла не найдены."
 
+            # Приоритет запроса: interactive (по умолчанию) или batch
+            lane = body.get("priority") or self.valves.VLM_PRIORITY
+
             # Декодируем файл
             try:
                 file_bytes = self._decode_file_data(file_data_b64)
@@ -257,14 +563,14 @@ class Pipeline:
                     import nest_asyncio
 
                     nest_asyncio.apply()
-                    result = asyncio.run(self._process_file(file_bytes, filename))
+                    result = asyncio.run(self._process_file(file_bytes, filename, lane))
                 else:
                     result = loop.run_until_complete(
-                        self._process_file(file_bytes, filename)
+                        self._process_file(file_bytes, filename, lane)
                     )
             except RuntimeError:
                 # Если нет event loop, создаем новый
-                result = asyncio.run(self._process_file(file_bytes, filename))
+                result = asyncio.run(self._process_file(file_bytes, filename, lane))
 
             # Возвращаем результат как JSON строку
             return json.dumps(result, ensure_ascii=False, indent=2)
@@ -1,3 +1,7 @@
+import time
+from functools import lru_cache
+
+from .lazy_imports import record_import_time
 from .schemas import parser
 
 SYSTEM_PROMPT_MD = """ 
@@ -28,7 +32,7 @@ FRAGMENT_PROMPT = """Выполни OCR изображения и верни в
 артефакты или неразборчивые элементы), немедленно заверши генерацию и верни пустую строку."""
 
 
-SYSTEM_PROMPT_JSON = f"""
+_SYSTEM_PROMPT_JSON_TEMPLATE = """
 Ты — эксперт в извлечении структурированных финансовых данных из форм бухгалтерской отчётности в Markdown формате.
 Твоя задача — **точно** выполнить следующие шаги:
 
@@ -79,5 +83,23 @@ SYSTEM_PROMPT_JSON = f"""
 - Для пустых ячеек ставь `null`, а не ноль и не произвольное число.
 
 
-{parser.get_format_instructions()}
+{format_instructions}
 """
+
+
+@lru_cache(maxsize=None)
+def get_system_prompt_json() -> str:
+    # Инструкции формата строятся по JSON-схеме, поэтому только при первом обращении
+    started = time.perf_counter()
+    prompt = _SYSTEM_PROMPT_JSON_TEMPLATE.format(
+        format_instructions=parser.get_format_instructions()
+    )
+    record_import_time("prompts.SYSTEM_PROMPT_JSON", time.perf_counter() - started)
+    return prompt
+
+
+def __getattr__(name: str):
+    # Совместимость: SYSTEM_PROMPT_JSON по-прежнему доступен как атрибут модуля
+    if name == "SYSTEM_PROMPT_JSON":
+        return get_system_prompt_json()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,161 @@
+"""Потоковая генерация OCR с обрывом зацикливаний и бюджетом токенов."""
+
+from typing import Any, List, NamedTuple, Optional
+
+from .config import (
+    OCR_INK_PIXELS_PER_TOKEN,
+    OCR_MAX_TOKENS,
+    OCR_MIN_TOKENS,
+    OCR_REPEAT_CHECK_EVERY,
+    OCR_REPEAT_MAX_PERIOD,
+    OCR_REPEAT_MIN_REPEATS,
+    OCR_REPEAT_MIN_SPAN,
+    OCR_REPEAT_TABLE_MIN_SPAN,
+)
+
+STOP_REPETITION = "repetition"
+STOP_LENGTH = "length"
+
+
+class OcrResult(NamedTuple):
+    """Результат потокового OCR тайла."""
+
+    text: str
+    stop_reason: Optional[str]
+    # Сколько символов реально сгенерировано, включая свёрнутый цикл
+    generated: int
+
+
+def estimate_token_budget(width: int, height: int, ink_ratio: float) -> int:
+    """
+    Оценивает максимальное число токенов ответа для тайла.
+
+    Объём текста пропорционален числу «чернильных» пикселей; оценка взята
+    с запасом, чтобы не обрезать плотные таблицы.
+
+    Args:
+        width: Ширина тайла в пикселях
+        height: Высота тайла в пикселях
+        ink_ratio: Доля «чернильных» пикселей тайла
+
+    Returns:
+        Значение max_tokens для запроса
+    """
+    ink_pixels = width * height * ink_ratio
+    budget = OCR_MIN_TOKENS + int(ink_pixels / OCR_INK_PIXELS_PER_TOKEN)
+    return min(OCR_MAX_TOKENS, budget)
+
+
+class RepetitionDetector:
+    """
+    Обнаруживает зацикливание генерации по хвосту потока.
+
+    Зацикливанием считается хвост, состоящий из одного и того же фрагмента
+    длиной до `max_period` символов, повторённого не меньше `min_repeats`
+    раз и занимающего не меньше `min_span` символов. Это покрывает как
+    повторяющиеся строки, так и циклы n-грамм внутри строки.
+
+    Цикл строк, состоящих только из вертикальных черт и пробелов (пустые
+    строки таблиц), считается зацикливанием лишь начиная с `table_min_span`
+    символов: такие строки легитимно повторяются десятки раз подряд.
+    """
+
+    def __init__(
+        self,
+        min_span: int = OCR_REPEAT_MIN_SPAN,
+        min_repeats: int = OCR_REPEAT_MIN_REPEATS,
+        max_period: int = OCR_REPEAT_MAX_PERIOD,
+        check_every: int = OCR_REPEAT_CHECK_EVERY,
+        table_min_span: int = OCR_REPEAT_TABLE_MIN_SPAN,
+    ):
+        self._min_span = min_span
+        self._min_repeats = min_repeats
+        self._max_period = max_period
+        self._check_every = check_every
+        self._table_min_span = table_min_span
+        self._window = max(
+            min_span, max_period * min_repeats, table_min_span + max_period
+        )
+        self._tail = ""
+        self._unchecked = 0
+        self.period: Optional[int] = None
+
+    def feed(self, chunk: str) -> bool:
+        """Добавляет фрагмент потока; возвращает True при обнаружении цикла."""
+        self._tail = (self._tail + chunk)[-self._window :]
+        self._unchecked += len(chunk)
+        if self._unchecked < self._check_every:
+            return False
+        self._unchecked = 0
+
+        tail = self._tail
+        for period in range(1, self._max_period + 1):
+            repeats = max(self._min_repeats, -(-self._min_span // period))
+            span = period * repeats
+            if span > len(tail):
+                continue
+            unit = tail[-period:]
+            if _is_blank_table_rows(unit):
+                repeats = max(repeats, -(-self._table_min_span // period))
+                span = period * repeats
+                if span > len(tail):
+                    continue
+            if tail[-span:] == unit * repeats:
+                self.period = period
+                return True
+        return False
+
+    def collapse(self, text: str) -> str:
+        """Сворачивает обнаруженный цикл в конце текста до одного повтора."""
+        if not self.period:
+            return text
+        unit = text[-self.period :]
+        while text.endswith(unit * 2):
+            text = text[: -self.period]
+        if "\n" in unit:
+            # Цикл строк: отбрасываем оборванную последнюю строку
+            text = text[: text.rfind("\n") + 1]
+        return text
+
+
+def _is_blank_table_rows(unit: str) -> bool:
+    return "\n" in unit and "|" in unit and not unit.strip("| \t\n")
+
+
+async def stream_ocr(
+    llm: Any, messages: list, max_tokens: int, **kwargs: Any
+) -> OcrResult:
+    """
+    Выполняет OCR в потоковом режиме, обрывая генерацию при зацикливании.
+
+    Прерывание потока закрывает соединение, и сервер прекращает генерацию.
+
+    Args:
+        llm: Клиент ChatOpenAI
+        messages: Сообщения запроса
+        max_tokens: Бюджет токенов ответа
+        **kwargs: Дополнительные параметры запроса (штрафы и т.п.)
+
+    Returns:
+        Текст ответа, причина обрыва (STOP_REPETITION, STOP_LENGTH или None)
+        и число сгенерированных символов
+    """
+    detector = RepetitionDetector()
+    parts: List[str] = []
+    stop_reason = None
+    generated = 0
+
+    stream = llm.astream(messages, max_tokens=max_tokens, **kwargs)
+    try:
+        async for chunk in stream:
+            parts.append(chunk.content)
+            generated += len(chunk.content)
+            if detector.feed(chunk.content):
+                text = detector.collapse("".join(parts))
+                return OcrResult(text, STOP_REPETITION, generated)
+            if chunk.response_metadata.get("finish_reason") == STOP_LENGTH:
+                stop_reason = STOP_LENGTH
+    finally:
+        await stream.aclose()
+
+    return OcrResult("".join(parts), stop_reason, generated)
@@ -0,0 +1,15 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+# Репозиторий — это сам пакет пайплайна (в OpenWebUI он лежит в папке OCR),
+# поэтому импортируем его по имени каталога.
+_REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_REPO.parent))
+
+
+@pytest.fixture(scope="session")
+def pkg():
+    return importlib.import_module(_REPO.name)
@@ -0,0 +1,81 @@
+import asyncio
+import importlib
+
+import httpx
+import openai
+import pytest
+
+
+@pytest.fixture
+def balancer(pkg):
+    return importlib.import_module(f"{pkg.__name__}.balancer")
+
+
+def _fail(pool, url, exc):
+    with pytest.raises(type(exc)):
+        with pool.lease(url):
+            raise exc
+
+
+def test_transport_errors_are_endpoint_errors(balancer):
+    request = httpx.Request("POST", "http://vlm:8000/v1/chat/completions")
+    for exc in (
+        httpx.ReadError("boom", request=request),
+        httpx.RemoteProtocolError("boom", request=request),
+        httpx.ConnectError("boom", request=request),
+        openai.APIConnectionError(request=request),
+    ):
+        assert balancer.is_endpoint_error(exc), type(exc).__name__
+    assert not balancer.is_endpoint_error(ValueError("bad request"))
+
+
+def test_pick_prefers_least_outstanding(balancer):
+    pool = balancer.EndpointPool(["a", "b", "c"])
+    with pool.lease("a"), pool.lease("a"), pool.lease("b"):
+        assert pool.pick() == "c"
+        assert pool.pick(exclude=["c"]) == "b"
+
+
+def test_failing_replica_is_ejected_and_readmitted(balancer, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(balancer.time, "monotonic", lambda: now[0])
+    pool = balancer.EndpointPool(["a", "b"], eject_failures=2, eject_seconds=30)
+    error = httpx.ReadError("boom")
+
+    _fail(pool, "a", error)
+    assert pool.pick() == "a"
+    _fail(pool, "a", error)
+    assert pool.pick() == "b"
+    assert pool.pick(exclude=["b"]) == "a"
+
+    now[0] += 31
+    assert pool.pick() == "a"
+    assert [ep["ejections"] for ep in pool.snapshot()] == [1, 0]
+
+
+def test_sticky_key_holds_replica_within_slack(balancer):
+    pool = balancer.EndpointPool(["a", "b", "c"], sticky_slack=1)
+    sticky = pool.pick("doc")
+    with pool.lease(sticky):
+        assert pool.pick("doc") == sticky
+        with pool.lease(sticky):
+            assert pool.pick("doc") != sticky
+
+
+def test_dead_replica_is_retried_on_another(pkg, monkeypatch):
+    pipeline = importlib.import_module(f"{pkg.__name__}.pipeline").Pipeline()
+    urls = ["http://vlm-1:8000/v1", "http://vlm-2:8000/v1"]
+    monkeypatch.setattr(pipeline.valves, "VLM_API_URLS", urls)
+    monkeypatch.setattr(pipeline.valves, "VLM_STICKY_ROUTING", False)
+    monkeypatch.setattr(pipeline, "_get_llm", lambda kind, url: url)
+
+    async def request(url):
+        if url == urls[0]:
+            raise httpx.RemoteProtocolError("peer closed connection")
+        return url
+
+    routed = []
+    result = asyncio.run(pipeline._call_vlm("json", request, routed=routed))
+
+    assert result == urls[1]
+    assert routed == urls
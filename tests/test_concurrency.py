@@ -0,0 +1,22 @@
+import asyncio
+
+
+def test_latency_is_normalized_by_work(pkg, monkeypatch):
+    concurrency = pkg.concurrency
+    limiter = concurrency.AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+    clock = [0.0]
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: clock[0])
+
+    async def request(seconds: float, work: float) -> None:
+        async with limiter.slot("ocr") as slot:
+            clock[0] += seconds
+            slot.work = work
+
+    async def main() -> None:
+        for _ in range(20):
+            await request(1.0, 100)
+        # Плотный тайл: в 10 раз больше работы за в 10 раз большее время
+        await request(10.0, 1000)
+
+    asyncio.run(main())
+    assert limiter.snapshot()["decreases"] == 0
@@ -0,0 +1,31 @@
+from PIL import Image, ImageDraw
+
+
+def _page(background: int, ink: int) -> Image.Image:
+    img = Image.new("L", (400, 300), background)
+    draw = ImageDraw.Draw(img)
+    for y in range(100, 200, 20):
+        draw.rectangle((100, y, 300, y + 8), fill=ink)
+    return img.convert("RGB")
+
+
+def test_dark_background_tile_is_kept_uncropped(pkg):
+    stats = {}
+    tile = pkg.file_processor.FileProcessor._make_tile(_page(20, 230), stats)
+    assert tile is not None
+    assert (tile.width, tile.height) == (400, 300)
+    assert stats["tiles_skipped"] == 0
+
+
+def test_uniform_dark_tile_is_skipped(pkg):
+    stats = {}
+    img = Image.new("RGB", (400, 300), (20, 20, 20))
+    assert pkg.file_processor.FileProcessor._make_tile(img, stats) is None
+    assert stats["tiles_skipped"] == 1
+
+
+def test_light_background_tile_is_cropped(pkg):
+    stats = {}
+    tile = pkg.file_processor.FileProcessor._make_tile(_page(255, 0), stats)
+    assert (tile.width, tile.height) == (233, 121)
+    assert stats["tiles_cropped"] == 1
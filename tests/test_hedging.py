@@ -0,0 +1,114 @@
+import asyncio
+import importlib
+
+
+def _modules(pkg):
+    hedging = importlib.import_module(f"{pkg.__name__}.hedging")
+    concurrency = importlib.import_module(f"{pkg.__name__}.concurrency")
+    return hedging, concurrency
+
+
+def test_queue_wait_is_not_hedged_or_timed_out(pkg):
+    hedging, concurrency = _modules(pkg)
+    hedger = hedging.Hedger(min_samples=3, min_delay=0.05)
+    limiter = concurrency.AdaptiveLimiter(initial=2, max_limit=2)
+    sent = []
+
+    async def tile():
+        async def call(is_hedge, on_dispatch):
+            async with limiter.slot("ocr"):
+                on_dispatch()
+                sent.append(is_hedge)
+                await asyncio.sleep(0.1)
+                return "ok"
+
+        return await hedger.run(
+            call, deadline=0.5, can_hedge=lambda: not limiter.has_waiters()
+        )
+
+    async def main():
+        return await asyncio.gather(*(tile() for _ in range(20)))
+
+    # 20 тайлов по 0.1 с при лимите 2 ждут в очереди до ~1 с — дольше дедлайна
+    assert asyncio.run(main()) == ["ok"] * 20
+    snapshot = hedger.snapshot()
+    assert snapshot["hedged"] == 0
+    assert snapshot["deadline_exceeded"] == 0
+    assert len(sent) == 20
+    assert snapshot["threshold"] < 0.2
+
+
+def test_straggler_is_hedged_and_loser_cancelled(pkg):
+    hedging, _ = _modules(pkg)
+    hedger = hedging.Hedger(min_samples=1, min_delay=0.05)
+    cancelled = []
+
+    async def main():
+        async def fast(is_hedge, on_dispatch):
+            on_dispatch()
+            await asyncio.sleep(0.01)
+            return "fast"
+
+        await hedger.run(fast)
+
+        async def call(is_hedge, on_dispatch):
+            on_dispatch()
+            try:
+                await asyncio.sleep(0.01 if is_hedge else 5)
+                return "hedge" if is_hedge else "primary"
+            except asyncio.CancelledError:
+                cancelled.append(is_hedge)
+                raise
+
+        result = await hedger.run(call, deadline=1)
+        await asyncio.sleep(0.01)
+        return result
+
+    assert asyncio.run(main()) == "hedge"
+    assert cancelled == [False]
+    assert hedger.snapshot()["hedge_wins"] == 1
+
+
+def test_early_wakeup_does_not_trip_deadline(pkg, monkeypatch):
+    hedging, _ = _modules(pkg)
+    hedger = hedging.Hedger(enabled=False)
+    real_wait = asyncio.wait
+
+    async def early_wait(fs, timeout=None, **kwargs):
+        # Таймер событийного цикла может сработать чуть раньше срока
+        if timeout is not None:
+            timeout /= 2
+        return await real_wait(fs, timeout=timeout, **kwargs)
+
+    monkeypatch.setattr(hedging.asyncio, "wait", early_wait)
+
+    async def call(is_hedge, on_dispatch):
+        on_dispatch()
+        await asyncio.sleep(0.15)
+        return "ok"
+
+    assert asyncio.run(hedger.run(call, deadline=0.2)) == "ok"
+    assert hedger.snapshot()["deadline_exceeded"] == 0
+
+
+def test_dense_tile_is_not_hedged_for_its_budget(pkg):
+    hedging, _ = _modules(pkg)
+    hedger = hedging.Hedger(min_samples=3, min_delay=0.01)
+
+    def tile(seconds):
+        async def call(is_hedge, on_dispatch):
+            on_dispatch()
+            await asyncio.sleep(seconds)
+            return "hedge" if is_hedge else "primary"
+
+        return call
+
+    async def main():
+        for _ in range(3):
+            await hedger.run(tile(0.03), work=1)
+        # В 8 раз больший бюджет и в 5 раз большая задержка — не отставание
+        return await hedger.run(tile(0.15), work=8)
+
+    assert asyncio.run(main()) == "primary"
+    assert hedger.snapshot()["hedged"] == 0
+    assert hedger.threshold(8) > 4 * hedger.threshold(1)
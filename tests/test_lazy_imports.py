@@ -0,0 +1,39 @@
+import hashlib
+import importlib
+import subprocess
+import sys
+from pathlib import Path
+
+_REPO = Path(__file__).resolve().parents[1]
+_HEAVY = ("cv2", "fitz", "docx", "langchain_openai")
+
+# SHA-256 прежнего f-string SYSTEM_PROMPT_JSON, в котором инструкции формата
+# заменены на "{format_instructions}": промпт должен остаться прежним
+_SYSTEM_PROMPT_JSON_SHA256 = (
+    "4a02d00603daa6197c51cdb9c0a5b526b5c018c1a48e6e70ab7abdcf386e06f0"
+)
+
+
+def test_package_import_leaves_heavy_modules_unloaded():
+    # Отдельный процесс: в этом тяжёлые модули уже импортированы другими тестами
+    code = (
+        "import sys; "
+        f"sys.path.insert(0, {str(_REPO.parent)!r}); "
+        f"import {_REPO.name}; "
+        f"print(','.join(m for m in {_HEAVY!r} if m in sys.modules))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    assert loaded == ""
+
+
+def test_system_prompt_json_matches_former_f_string(pkg):
+    prompts = importlib.import_module(f"{pkg.__name__}.prompts")
+    instructions = prompts.parser.get_format_instructions()
+    prompt = prompts.SYSTEM_PROMPT_JSON
+
+    assert prompt == prompts.get_system_prompt_json()
+    assert prompt.count(instructions) == 1
+    template = prompt.replace(instructions, "{format_instructions}")
+    assert hashlib.sha256(template.encode()).hexdigest() == _SYSTEM_PROMPT_JSON_SHA256
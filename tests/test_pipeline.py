@@ -0,0 +1,174 @@
+import asyncio
+import importlib
+
+import pytest
+
+
+class _Chunk:
+    def __init__(self, content, finish_reason=None):
+        self.content = content
+        self.response_metadata = (
+            {"finish_reason": finish_reason} if finish_reason else {}
+        )
+
+
+class _StubLLM:
+    """Заглушка ChatOpenAI: отдаёт фиксированный Markdown потоком."""
+
+    def __init__(self, text="## Баланс\n| Код | 2025 |\n|---|---|\n| 110 | 9 044 |"):
+        self.text = text
+        self.calls = []
+
+    def astream(self, messages, **kwargs):
+        self.calls.append(kwargs)
+
+        async def gen():
+            for i in range(0, len(self.text), 8):
+                yield _Chunk(self.text[i : i + 8])
+            yield _Chunk("", "stop")
+
+        return gen()
+
+
+@pytest.fixture
+def pipeline(pkg):
+    return importlib.import_module(f"{pkg.__name__}.pipeline").Pipeline()
+
+
+@pytest.fixture
+def tile(pkg):
+    ImageTile = importlib.import_module(f"{pkg.__name__}.file_processor").ImageTile
+    return ImageTile("aGVsbG8=", 800, 600, 0.05)
+
+
+def test_get_llm_builds_clients_for_both_stages(pipeline):
+    ocr = pipeline._get_llm("ocr", "http://vlm:8000/v1")
+    json_llm = pipeline._get_llm("json", "http://vlm:8000/v1")
+    assert ocr is not json_llm
+    assert pipeline._get_llm("ocr", "http://vlm:8000/v1") is ocr
+    assert ocr.max_retries == 0 and json_llm.max_retries == 0
+
+
+def test_invoke_vlm_ocr_with_stub_client(pipeline, tile, monkeypatch):
+    stub = _StubLLM()
+    monkeypatch.setattr(pipeline, "_get_llm", lambda kind, url: stub)
+
+    stats = {}
+    md = asyncio.run(pipeline._invoke_vlm_ocr([tile, tile], stats=stats))
+
+    assert md.count("| 110 | 9 044 |") == 2
+    assert len(stub.calls) == 2
+    assert all(call["max_tokens"] > 0 for call in stub.calls)
+    assert stats["tiles_timed_out"] == 0
+    assert stats["truncated_tiles"] == []
+
+
+def test_warm_up_reports_client_errors_instead_of_raising(pipeline, monkeypatch):
+    def broken(kind, url):
+        raise ImportError("langchain_openai")
+
+    monkeypatch.setattr(pipeline, "_get_llm", broken)
+    pipeline.valves.VLM_WARMUP = True
+
+    asyncio.run(pipeline.on_startup())
+
+    report = pipeline.warmup_report
+    assert report["requests"] == 2
+    assert len(report["errors"]) == 2
+
+
+class _Overloaded(Exception):
+    status_code = 503
+
+
+def test_single_endpoint_retries_after_503(pipeline, tile, monkeypatch):
+    stub = _StubLLM()
+    failures = [_Overloaded("Service Unavailable")]
+
+    def get_llm(kind, url):
+        if failures:
+            raise failures.pop()
+        return stub
+
+    monkeypatch.setattr(pipeline, "_get_llm", get_llm)
+    monkeypatch.setattr(pipeline.valves, "VLM_API_URLS", [])
+
+    md = asyncio.run(pipeline._invoke_vlm_ocr([tile]))
+
+    assert "| 110 | 9 044 |" in md
+    assert len(stub.calls) == 1
+
+
+class _HangingLLM(_StubLLM):
+    def astream(self, messages, **kwargs):
+        async def gen():
+            await asyncio.sleep(10)
+            yield _Chunk("")
+
+        return gen()
+
+
+def test_tile_deadline_reaches_limiter_as_timeout(pkg, pipeline, tile, monkeypatch):
+    module = importlib.import_module(f"{pkg.__name__}.pipeline")
+    limiter = pkg.concurrency.AdaptiveLimiter()
+    monkeypatch.setattr(module, "vlm_limiter", limiter)
+    monkeypatch.setattr(module, "ocr_hedger", pkg.hedging.Hedger(enabled=False))
+    monkeypatch.setattr(module, "OCR_TILE_DEADLINE", 0.1)
+    monkeypatch.setattr(pipeline, "_get_llm", lambda kind, url: _HangingLLM())
+
+    stats = {}
+    assert asyncio.run(pipeline._invoke_vlm_ocr([tile], stats=stats)) == ""
+
+    assert stats["tiles_timed_out"] == 1
+    assert limiter.snapshot()["overloads"] == 1
+
+
+class _LoopingLLM(_StubLLM):
+    """Первый запрос зацикливается на одной строке, повтор ведёт себя как `retry`."""
+
+    def __init__(self, retry):
+        super().__init__()
+        self.retry = retry
+
+    def astream(self, messages, **kwargs):
+        if self.calls:
+            return self.retry.astream(messages, **kwargs)
+        self.calls.append(kwargs)
+
+        async def gen():
+            yield _Chunk("| Код | 2025 |\n")
+            while True:
+                yield _Chunk("| 110 | 9 044 |\n")
+
+        return gen()
+
+
+def test_repetition_abort_retries_with_penalties(pipeline, tile, monkeypatch):
+    retry = _StubLLM()
+    stub = _LoopingLLM(retry)
+    monkeypatch.setattr(pipeline, "_get_llm", lambda kind, url: stub)
+
+    stats = {}
+    md = asyncio.run(pipeline._invoke_vlm_ocr([tile], stats=stats))
+
+    assert md.startswith("## Баланс")
+    assert stats["repetition_aborts"] == 1
+    assert stats["truncated_tiles"] == []
+    assert "presence_penalty" not in stub.calls[0]
+    assert retry.calls[0]["presence_penalty"] > 0
+    assert "repetition_penalty" in retry.calls[0]["extra_body"]
+
+
+def test_retry_timeout_keeps_collapsed_first_attempt(pkg, pipeline, tile, monkeypatch):
+    module = importlib.import_module(f"{pkg.__name__}.pipeline")
+    monkeypatch.setattr(module, "ocr_hedger", pkg.hedging.Hedger(enabled=False))
+    monkeypatch.setattr(module, "OCR_TILE_DEADLINE", 0.5)
+    stub = _LoopingLLM(_HangingLLM())
+    monkeypatch.setattr(pipeline, "_get_llm", lambda kind, url: stub)
+
+    stats = {}
+    md = asyncio.run(pipeline._invoke_vlm_ocr([tile], stats=stats))
+
+    assert md.count("| 110 | 9 044 |") == 1
+    assert stats["tiles_timed_out"] == 0
+    assert stats["truncated_tiles"] == [{"tile": 0, "reason": "repetition"}]
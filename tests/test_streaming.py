@@ -0,0 +1,21 @@
+def _feed(detector, text: str, chunk: int = 8) -> bool:
+    return any(detector.feed(text[i : i + chunk]) for i in range(0, len(text), chunk))
+
+
+def test_empty_table_rows_are_not_a_loop(pkg):
+    detector = pkg.streaming.RepetitionDetector()
+    text = "| Статья | Код |\n|---|---|\n" + "|  |  |  |  |  |  |\n" * 40
+    assert not _feed(detector, text)
+
+
+def test_runaway_empty_table_rows_are_a_loop(pkg):
+    detector = pkg.streaming.RepetitionDetector()
+    assert _feed(detector, "|  |  |  |  |  |  |\n" * 400)
+    assert detector.period % 20 == 0
+
+
+def test_repeated_text_lines_are_a_loop(pkg):
+    detector = pkg.streaming.RepetitionDetector()
+    text = "| Итого по разделу | 1 234 | 5 678 |\n" * 40
+    assert _feed(detector, text)
+    assert detector.collapse(text) == "| Итого по разделу | 1 234 | 5 678 |\n"